@@ -0,0 +1,95 @@
+"""
+Measures the throughput of CeeSysLogHandler and AsyncCeeSysLogHandler with an increasing
+number of logging threads, compared to emitting under the handler lock as done by
+logging.Handler.handle.
+
+Usage::
+
+    python benchmarks/threaded_emit.py [--records 20000] [--threads 1 2 4 8 16 32 64]
+
+Note that formatting is pure Python, so on interpreters with a global interpreter lock the
+formatting itself cannot scale with the number of threads. What the benchmark shows is that
+threads no longer queue up on the handler lock while others format or wait on the socket.
+With a local collector that keeps up, all handlers perform within noise of each other.
+"""
+import argparse
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+
+# run against the checkout this script belongs to
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cee_syslog_handler import AsyncCeeSysLogHandler, CeeSysLogHandler
+
+
+class LockedCeeSysLogHandler(CeeSysLogHandler):
+    """CeeSysLogHandler emitting under the handler lock like logging.Handler.handle."""
+
+    handle = logging.Handler.handle
+
+
+def _run(handler_class, address, thread_count, record_count):
+    handler = handler_class(address=address)
+    per_thread = record_count // thread_count
+    start_barrier = threading.Barrier(thread_count + 1)
+
+    def log():
+        records = [
+            logging.makeLogRecord(
+                {"name": "bench", "msg": "message %d", "args": (i,), "field": i}
+            )
+            for i in range(per_thread)
+        ]
+        start_barrier.wait()
+        for record in records:
+            handler.handle(record)
+
+    threads = [threading.Thread(target=log) for _ in range(thread_count)]
+    for thread in threads:
+        thread.start()
+    start_barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    handler.flush()
+    elapsed = time.perf_counter() - start
+    handler.close()
+    return per_thread * thread_count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument(
+        "--threads", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64]
+    )
+    args = parser.parse_args()
+
+    # a local sink that is never read, the kernel drops what does not fit its buffer
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(("localhost", 0))
+    address = sink.getsockname()
+
+    handler_classes = [LockedCeeSysLogHandler, CeeSysLogHandler, AsyncCeeSysLogHandler]
+    print(
+        "threads "
+        + " ".join("{:>24}".format(c.__name__) for c in handler_classes)
+        + "  (records/s)"
+    )
+    for thread_count in args.threads:
+        rates = [
+            _run(c, address, thread_count, args.records) for c in handler_classes
+        ]
+        print(
+            "{:>7} ".format(thread_count)
+            + " ".join("{:>24.0f}".format(rate) for rate in rates)
+        )
+    sink.close()
+
+
+if __name__ == "__main__":
+    main()
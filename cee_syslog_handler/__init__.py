@@ -1,9 +1,14 @@
 import json
 import logging
+import queue
 import re
 import socket
+import threading
+import time
 import traceback
-from datetime import datetime
+from collections import deque, namedtuple
+from datetime import date, datetime
+from datetime import time as datetime_time
 from logging.handlers import SYSLOG_UDP_PORT, SysLogHandler
 
 SYSLOG_LEVELS = {
@@ -50,7 +55,9 @@ _STANDARD_FIELDS = set(
 _SKIPPED_FIELDS = _STANDARD_FIELDS | set(("id", "_id"))
 
 
-_SUPPORTED_OUTPUT_TYPES = (str, float, int)
+_CONVERSION_ERROR_VALUE = "value could not be converted to str"
+
+_SCALAR_OUTPUT_TYPES = (str, int, float, type(None))
 
 
 # see http://github.com/hoffmann/graypy/blob/master/graypy/handler.py
@@ -58,10 +65,33 @@ def get_full_message(exc_info, message):
     return "\n".join(traceback.format_exception(*exc_info)) if exc_info else message
 
 
+def get_logger_fields(logger_name, facility):
+    """
+    Returns the message fields that only depend on the name of the emitting logger and the
+    configured facility.
+    """
+    logger_fields = {
+        "facility": facility or logger_name,
+        "source_facility": facility or logger_name,
+    }
+    if facility is not None:
+        logger_fields["_logger"] = logger_name
+    return logger_fields
+
+
 # see http://github.com/hoffmann/graypy/blob/master/graypy/handler.py
 def make_message_dict(
-    record, fqdn, debugging_fields, extra_fields, facility, static_fields
+    record,
+    fqdn,
+    debugging_fields,
+    extra_fields,
+    facility,
+    static_fields,
+    logger_fields=None,
 ):
+    if logger_fields is None:
+        logger_fields = get_logger_fields(record.name, facility)
+
     message = record.getMessage()
     message_dict = {
         "host": fqdn,
@@ -69,12 +99,8 @@ def make_message_dict(
         "message": get_full_message(record.exc_info, message),
         "timestamp": record.created,
         "level": SYSLOG_LEVELS.get(record.levelno, record.levelno),
-        "facility": facility or record.name,
-        "source_facility": facility or record.name,
     }
-
-    if facility is not None:
-        message_dict.update({"_logger": record.name})
+    message_dict.update(logger_fields)
 
     if debugging_fields:
         message_dict.update(
@@ -96,15 +122,110 @@ def make_message_dict(
     return message_dict
 
 
-def _to_supported_output_type(value):
-    if not isinstance(value, _SUPPORTED_OUTPUT_TYPES):
+def _identity(value):
+    return value
+
+
+def _to_str(value):
+    return str(value)
+
+
+def _to_isoformat(value):
+    return value.isoformat()
+
+
+def _flatten_dict(value):
+    # CEE messages must not contain lists, nested dictionaries are flattened into keys
+    # joined by dots, which do not clash with field names given as python identifiers
+    if not value:
+        return "{}"
+    flat = {}
+    for key, child in value.items():
+        _add_field(flat, str(key), child)
+    return flat
+
+
+# Converters by value type, looked up along the MRO of a value's type. Values of types
+# without a converter are converted using str.
+_CONVERTERS = {
+    str: _identity,
+    int: _identity,
+    float: _identity,
+    bool: _identity,
+    type(None): _identity,
+    date: _to_isoformat,
+    datetime: _to_isoformat,
+    datetime_time: _to_isoformat,
+    dict: _flatten_dict,
+}
+
+# Resolved converter for each value type seen so far
+_converter_cache = {}
+
+
+def register_converter(value_type, converter):
+    """
+    Registers a function converting field values of the given type (and its subclasses) to
+    a value supported in the log message: str, int, float, bool, None or a dict of those.
+    Other return values and exceptions raised by the converter are replaced by the str
+    representation of the value.
+
+    Usage::
+
+        from decimal import Decimal
+        from cee_syslog_handler import register_converter
+
+        register_converter(Decimal, float)
+    """
+    _CONVERTERS[value_type] = _checked_converter(converter)
+    _converter_cache.clear()
+
+
+def _checked_converter(converter):
+    def convert(value):
         try:
+            result = converter(value)
+        except Exception:
             return str(value)
-        except:
-            # make logging nothrow
-            return "value could not be converted to str"
+        if isinstance(result, _SCALAR_OUTPUT_TYPES):
+            return result
+        if type(result) is dict:
+            return _flatten_dict(result)
+        # converters must not introduce lists or values json cannot serialize
+        return str(value)
+
+    return convert
+
+
+def unregister_converter(value_type):
+    """
+    Removes the converter registered for the given type.
+    """
+    del _CONVERTERS[value_type]
+    _converter_cache.clear()
+
+
+def _resolve_converter(value_type):
+    for cls in value_type.__mro__:
+        if cls in _CONVERTERS:
+            converter = _CONVERTERS[cls]
+            break
     else:
-        return value
+        converter = _to_str
+    _converter_cache[value_type] = converter
+    return converter
+
+
+def _to_supported_output_type(value):
+    try:
+        converter = _converter_cache[type(value)]
+    except KeyError:
+        converter = _resolve_converter(type(value))
+    try:
+        return converter(value)
+    except Exception:
+        # make logging nothrow
+        return _CONVERSION_ERROR_VALUE
 
 
 def _custom_key(key):
@@ -114,8 +235,21 @@ def _custom_key(key):
         return "_{}".format(key)
 
 
+def _add_field(fields, key, value):
+    value = _to_supported_output_type(value)
+    if type(value) is dict:
+        for child_key, leaf in value.items():
+            # flattened values never replace existing fields
+            fields.setdefault("{}.{}".format(key, child_key), leaf)
+    else:
+        fields[key] = value
+
+
 def _sanitize_fields(fields):
-    return {_custom_key(k): _to_supported_output_type(v) for k, v in fields.items()}
+    sanitized = {}
+    for key, value in fields.items():
+        _add_field(sanitized, _custom_key(key), value)
+    return sanitized
 
 
 # See http://github.com/hoffmann/graypy/blob/master/graypy/handler.py
@@ -124,8 +258,7 @@ def get_fields(message_dict, record):
     unskipped_field_names = set(fields.keys()) - _SKIPPED_FIELDS
 
     for key in sorted(unskipped_field_names, reverse=True):
-        value = fields[key]
-        message_dict[_custom_key(key)] = _to_supported_output_type(value)
+        _add_field(message_dict, _custom_key(key), fields[key])
 
     return message_dict
 
@@ -188,6 +321,203 @@ class JsonFormatter(logging.Formatter):
         return json.dumps(record)
 
 
+# Per logger name state of a CeeSysLogHandler:
+# - fields: the message fields that only depend on the logger name (see get_logger_fields)
+# - accepted: whether the name based filters in front of all other filters let records of
+#   this logger pass
+# - filters: the remaining filters in configured order, with name based filters replaced by
+#   _REJECTED if they drop records of this logger and left out otherwise
+_LoggerCacheEntry = namedtuple("_LoggerCacheEntry", ("fields", "accepted", "filters"))
+
+
+_REJECTED = object()
+
+
+def _is_name_filter(f):
+    # Plain logging.Filter instances decide by the logger name only
+    return type(f) is logging.Filter
+
+
+def _apply_filter(f, record):
+    if hasattr(f, "filter"):
+        return f.filter(record)
+    return f(record)
+
+
+class _ReplayRecord(logging.LogRecord):
+    """
+    A log record carrying an already built message, e.g. one replayed from an archive (see
+    archive.make_replay_record). CeeSysLogHandler sends the message as is.
+    """
+
+    def __init__(self, name, levelno, msg, created, message_dict):
+        super(_ReplayRecord, self).__init__(name, levelno, "", 0, msg, (), None)
+        self.created = created
+        self.message_dict = message_dict
+
+
+HealthTransition = namedtuple("HealthTransition", ("time", "old_state", "new_state"))
+
+
+class HealthMonitor(object):
+    """
+    Tracks the latency and the error rate of the most recent sends to the syslog server and
+    derives a health state from them:
+
+    - healthy: all records are sent
+    - degraded: records below ``degraded_level`` (DEBUG and INFO by default) are shed
+    - shedding: records below ``shedding_level`` (everything below ERROR by default) are shed
+
+    Only sends within the last ``sample_horizon`` seconds are taken into account. While
+    records are shed, one record per ``probe_interval`` is sent anyway, so the state can
+    recover even if only low level records are logged. Error reports by the handler
+    (tracebacks on stderr) are limited to one per ``error_report_interval``.
+
+    Usage::
+
+        monitor = HealthMonitor()
+        handler = CeeSysLogHandler(("10.2.160.20", 514), health_monitor=monitor)
+        ...
+        monitor.state, monitor.history
+    """
+
+    HEALTHY = "healthy"
+    DEGRADED = "degraded"
+    SHEDDING = "shedding"
+
+    def __init__(
+        self,
+        window=100,
+        min_samples=10,
+        sample_horizon=10.0,
+        degraded_latency=0.05,
+        shedding_latency=0.5,
+        degraded_error_rate=0.05,
+        shedding_error_rate=0.5,
+        degraded_level=logging.WARNING,
+        shedding_level=logging.ERROR,
+        probe_interval=1.0,
+        error_report_interval=60.0,
+        history_size=100,
+    ):
+        """
+        :param window: Number of most recent sends the state is derived from
+        :param min_samples: Number of sends needed before leaving the healthy state
+        :param sample_horizon: Seconds after which a send is no longer taken into account
+        :param degraded_latency: Mean send latency in seconds from which on the state is degraded
+        :param shedding_latency: Mean send latency in seconds from which on records are shed
+        :param degraded_error_rate: Fraction of failed sends from which on the state is degraded
+        :param shedding_error_rate: Fraction of failed sends from which on records are shed
+        :param degraded_level: Lowest level still sent in the degraded state
+        :param shedding_level: Lowest level still sent in the shedding state
+        :param probe_interval: Seconds after which a record is sent even if it would be shed
+        :param error_report_interval: Minimum number of seconds between two error reports
+        :param history_size: Number of state transitions kept in the history
+        """
+        # (time, latency, failed) of the recent sends, with running totals
+        self._samples = deque()
+        self._window = window
+        self._latency_sum = 0.0
+        self._failure_count = 0
+        self._min_samples = min_samples
+        self._sample_horizon = sample_horizon
+        self._degraded_latency = degraded_latency
+        self._shedding_latency = shedding_latency
+        self._degraded_error_rate = degraded_error_rate
+        self._shedding_error_rate = shedding_error_rate
+        self._min_levels = {
+            self.HEALTHY: logging.NOTSET,
+            self.DEGRADED: degraded_level,
+            self.SHEDDING: shedding_level,
+        }
+        self._probe_interval = probe_interval
+        self._error_report_interval = error_report_interval
+        self._last_send = time.monotonic()
+        self._last_error_report = None
+        self._lock = threading.Lock()
+        self._history = deque(maxlen=history_size)
+        self.state = self.HEALTHY
+        self.shed_count = 0
+        self.suppressed_error_count = 0
+
+    @property
+    def history(self):
+        """
+        The most recent state transitions as list of HealthTransition, oldest first.
+        """
+        return list(self._history)
+
+    def accepts(self, levelno):
+        """
+        Returns whether a record of the given level shall be sent in the current state.
+        """
+        if levelno >= self._min_levels[self.state]:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_send >= self._probe_interval:
+                self._last_send = now
+                return True
+            self.shed_count += 1
+            return False
+
+    def record_send(self, latency, failed=False):
+        """
+        Records a send to the syslog server which took ``latency`` seconds.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._last_send = now
+            self._samples.append((now, latency, failed))
+            self._latency_sum += latency
+            self._failure_count += failed
+            while (
+                len(self._samples) > self._window
+                or now - self._samples[0][0] > self._sample_horizon
+            ):
+                _, old_latency, old_failed = self._samples.popleft()
+                self._latency_sum -= old_latency
+                self._failure_count -= old_failed
+            count = len(self._samples)
+            # leaving a degraded state only needs the recent sends
+            if count < self._min_samples and self.state == self.HEALTHY:
+                return
+
+            mean_latency = self._latency_sum / count
+            error_rate = self._failure_count / count
+            if (
+                mean_latency >= self._shedding_latency
+                or error_rate >= self._shedding_error_rate
+            ):
+                state = self.SHEDDING
+            elif (
+                mean_latency >= self._degraded_latency
+                or error_rate >= self._degraded_error_rate
+            ):
+                state = self.DEGRADED
+            else:
+                state = self.HEALTHY
+
+            if state != self.state:
+                self._history.append(HealthTransition(time.time(), self.state, state))
+                self.state = state
+
+    def should_report_error(self):
+        """
+        Returns whether a failed send shall be reported, at most once per error_report_interval.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if (
+                self._last_error_report is None
+                or now - self._last_error_report >= self._error_report_interval
+            ):
+                self._last_error_report = now
+                return True
+            self.suppressed_error_count += 1
+            return False
+
+
 class CeeSysLogHandler(SysLogHandler):
     """
     A syslog handler that formats extra fields as a CEE compatible structured log message. A CEE
@@ -232,6 +562,8 @@ class CeeSysLogHandler(SysLogHandler):
         debugging_fields=True,
         extra_fields=True,
         facility=None,
+        health_monitor=None,
+        send_timeout=None,
         **kwargs
     ):
         """
@@ -244,6 +576,10 @@ class CeeSysLogHandler(SysLogHandler):
         :param extra_fields: Whether to include extra fields (submitted via the keyword argument
             extra to a logger) in the log dictionary
         :param facility: If not specified uses the logger's name as facility
+        :param health_monitor: If specified, a HealthMonitor measuring the sends and deciding
+            which records are shed when the syslog server is slow or unavailable
+        :param send_timeout: If specified, the number of seconds after which a send fails. A TCP
+            connection is re-established after a timed out send.
         :param kwargs: Additional static fields to be injected in each message.
         """
         super(CeeSysLogHandler, self).__init__(
@@ -254,18 +590,291 @@ class CeeSysLogHandler(SysLogHandler):
         self._facility = facility
         self._static_fields = _sanitize_fields(kwargs)
         self._fqdn = socket.getfqdn()
+        self._logger_cache = {}
+        self.health_monitor = health_monitor
+        self._send_timeout = send_timeout
+        self._apply_send_timeout()
+
+    def _apply_send_timeout(self):
+        if self.socket is not None and self._send_timeout is not None:
+            self.socket.settimeout(self._send_timeout)
+
+    @property
+    def cee_facility(self):
+        """
+        The facility field of the messages, None to use the logger's name. Not to be confused
+        with the syslog facility SysLogHandler.facility.
+        """
+        return self._facility
+
+    @cee_facility.setter
+    def cee_facility(self, facility):
+        self._facility = facility
+        self.clear_logger_cache()
+
+    def clear_logger_cache(self):
+        """
+        Drops all cached per logger state. Called by addFilter, removeFilter and when setting
+        cee_facility.
+        """
+        self._logger_cache = {}
+
+    def addFilter(self, filter):
+        super(CeeSysLogHandler, self).addFilter(filter)
+        self.clear_logger_cache()
+
+    def removeFilter(self, filter):
+        super(CeeSysLogHandler, self).removeFilter(filter)
+        self.clear_logger_cache()
+
+    def _get_logger_cache_entry(self, logger_name):
+        # An entry built while the configuration changes ends up in the replaced dict
+        cache = self._logger_cache
+        entry = cache.get(logger_name)
+        if entry is None:
+            name_record = logging.makeLogRecord({"name": logger_name})
+            accepted = True
+            filters = []
+            for f in self.filters:
+                if not _is_name_filter(f):
+                    filters.append(f)
+                elif not f.filter(name_record):
+                    # filters in front of a rejecting one may still alter the record
+                    if filters:
+                        filters.append(_REJECTED)
+                    else:
+                        accepted = False
+                    break
+            entry = _LoggerCacheEntry(
+                fields=get_logger_fields(logger_name, self._facility),
+                accepted=accepted,
+                filters=tuple(filters),
+            )
+            cache[logger_name] = entry
+        return entry
+
+    def filter(self, record):
+        """
+        Like logging.Filterer.filter, but the decisions of filters only depending on the
+        logger name are cached per logger name. Filters are applied in configured order.
+        """
+        entry = self._get_logger_cache_entry(record.name)
+        if not entry.accepted:
+            return False
+
+        rv = True
+        for f in entry.filters:
+            if f is _REJECTED:
+                return False
+            result = _apply_filter(f, record)
+            if not result:
+                return False
+            if isinstance(result, logging.LogRecord):
+                record = rv = result
+        return rv
 
     def format(self, record):
-        message = make_message_dict(
-            record,
-            self._fqdn,
-            self._debugging_fields,
-            self._extra_fields,
-            self._facility,
-            self._static_fields,
-        )
+        if isinstance(record, _ReplayRecord):
+            message = record.message_dict
+        else:
+            message = make_message_dict(
+                record,
+                self._fqdn,
+                self._debugging_fields,
+                self._extra_fields,
+                self._facility,
+                self._static_fields,
+                self._get_logger_cache_entry(record.name).fields,
+            )
         return ": @cee: %s" % json.dumps(message)
 
+    def handle(self, record):
+        """
+        Unlike logging.Handler.handle, this does not hold the handler lock while emitting the
+        record. Only the socket write in emit is serialized, so threads format concurrently.
+        """
+        rv = self.filter(record)
+        if isinstance(rv, logging.LogRecord):
+            record = rv
+        if rv and self.health_monitor is not None:
+            rv = self.health_monitor.accepts(record.levelno)
+        if rv:
+            self.emit(record)
+        return rv
+
+    def emit(self, record):
+        try:
+            data = self._encode_message(record)
+        except Exception:
+            self.handleError(record)
+            return
+        self.acquire()
+        try:
+            self._send_monitored(record, data)
+        finally:
+            self.release()
+
+    def handleError(self, record):
+        if self.health_monitor is None or self.health_monitor.should_report_error():
+            super(CeeSysLogHandler, self).handleError(record)
+
+    def _send_monitored(self, record, data):
+        if self.health_monitor is None:
+            try:
+                self._send_message(data)
+            except Exception:
+                self.handleError(record)
+            return
+
+        start = time.monotonic()
+        try:
+            self._send_message(data)
+        except Exception:
+            self.health_monitor.record_send(time.monotonic() - start, failed=True)
+            self.handleError(record)
+        else:
+            self.health_monitor.record_send(time.monotonic() - start)
+
+    def _encode_message(self, record):
+        msg = self.format(record)
+        if self.ident:
+            msg = self.ident + msg
+        if self.append_nul:
+            msg += "\000"
+        prio = "<%d>" % self.encodePriority(
+            self.facility, self.mapPriority(record.levelname)
+        )
+        return prio.encode("utf-8") + msg.encode("utf-8")
+
+    def _send_message(self, data):
+        # see logging.handlers.SysLogHandler.emit
+        if not self.socket:
+            self.createSocket()
+            self._apply_send_timeout()
+
+        if self.unixsocket:
+            try:
+                self.socket.send(data)
+            except OSError:
+                self.socket.close()
+                self._connect_unixsocket(self.address)
+                self.socket.send(data)
+        elif self.socktype == socket.SOCK_DGRAM:
+            self.socket.sendto(data, self.address)
+        else:
+            try:
+                self.socket.sendall(data)
+            except socket.timeout:
+                # part of the message may have been sent, continue on a new connection
+                self.socket.close()
+                self.socket = None
+                raise
+
+
+class AsyncCeeSysLogHandler(CeeSysLogHandler):
+    """
+    A CeeSysLogHandler that formats records in the logging thread and hands the encoded
+    messages over to a background writer thread, which is the only one writing to the
+    socket. Logging threads never wait on the socket.
+
+    At most ``max_queue_size`` messages are queued, further messages are dropped and counted
+    in ``dropped_count`` until the writer caught up. Messages still queued are sent on flush
+    and close, records emitted after close are sent synchronously. Close waits at most
+    ``close_timeout`` seconds for the writer, messages it could not send by then are dropped.
+    """
+
+    _STOP = object()
+
+    def __init__(self, *args, max_queue_size=10000, close_timeout=5.0, **kwargs):
+        """
+        Takes the same arguments as CeeSysLogHandler.
+
+        :param max_queue_size: Maximum number of messages waiting for the writer thread
+        :param close_timeout: Maximum number of seconds close waits for queued messages
+        """
+        super(AsyncCeeSysLogHandler, self).__init__(*args, **kwargs)
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._close_timeout = close_timeout
+        # guards _closed and dropped_count, so no message is queued behind _STOP
+        self._queue_lock = threading.Lock()
+        self._closed = False
+        self.dropped_count = 0
+        self._writer = threading.Thread(
+            target=self._write_messages, name="AsyncCeeSysLogHandler", daemon=True
+        )
+        self._writer.start()
+
+    def emit(self, record):
+        try:
+            data = self._encode_message(record)
+        except Exception:
+            self.handleError(record)
+            return
+        with self._queue_lock:
+            if not self._closed:
+                try:
+                    self._queue.put_nowait((record, data))
+                except queue.Full:
+                    self.dropped_count += 1
+                return
+        self.acquire()
+        try:
+            self._send_monitored(record, data)
+        finally:
+            self.release()
+
+    def _write_messages(self):
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                # release flushes that raced with close
+                self._drop_queued()
+                return
+            if isinstance(item, threading.Event):
+                item.set()
+                continue
+            record, data = item
+            self._send_monitored(record, data)
+
+    def flush(self):
+        """
+        Blocks until all messages emitted before the call have been sent.
+        """
+        if not self._closed and self._writer.is_alive():
+            sent = threading.Event()
+            self._queue.put(sent)
+            while not sent.wait(0.1) and self._writer.is_alive():
+                pass
+
+    def close(self):
+        with self._queue_lock:
+            self._closed = True
+        if self._writer.is_alive():
+            deadline = time.monotonic() + self._close_timeout
+            try:
+                self._queue.put(self._STOP, timeout=self._close_timeout)
+            except queue.Full:
+                self._drop_queued()
+                self._queue.put_nowait(self._STOP)
+            self._writer.join(max(0.0, deadline - time.monotonic()))
+            if self._writer.is_alive():
+                # the writer is stuck on the socket, it stops once the send returns
+                self._drop_queued()
+                self._queue.put_nowait(self._STOP)
+        super(AsyncCeeSysLogHandler, self).close()
+
+    def _drop_queued(self):
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is not self._STOP:
+                with self._queue_lock:
+                    self.dropped_count += 1
+
 
 class NamedCeeLogger(CeeSysLogHandler):
     def __init__(self, address, socket_type, name):
@@ -0,0 +1,333 @@
+"""
+Batch export of structured log messages into NDJSON segment files and replay of those
+segments through a CeeSysLogHandler.
+
+Usage::
+
+    import logging
+    from cee_syslog_handler.archive import NdjsonArchiveHandler
+
+    logger = logging.getLogger('log')
+    logger.addHandler(NdjsonArchiveHandler('/var/log/archive/app', compress=True))
+
+Replay of archived segments at most 500 messages per second::
+
+    python -m cee_syslog_handler.archive --host 10.2.160.20 --rate 500 /var/log/archive/app.*
+"""
+import argparse
+import glob
+import gzip
+import json
+import logging
+import os
+import socket
+import time
+from logging.handlers import SYSLOG_UDP_PORT, BufferingHandler
+
+from cee_syslog_handler import (
+    SYSLOG_LEVELS,
+    CeeSysLogHandler,
+    _ReplayRecord,
+    _sanitize_fields,
+    make_message_dict,
+)
+
+# Fields with few distinct values, stored dictionary encoded in columnar segments
+DICTIONARY_FIELDS = ("host", "facility", "source_facility", "level")
+
+_LOGGING_LEVELS = {v: k for k, v in SYSLOG_LEVELS.items()}
+
+
+def encode_columnar(message_dicts):
+    """
+    Encodes a list of message dictionaries as a single columnar block. Every field becomes
+    one column with one entry per message, the fields in DICTIONARY_FIELDS hold indices into
+    a list of their distinct values. Rows not containing a field are listed under "missing".
+    """
+    keys = []
+    seen = set()
+    for message_dict in message_dicts:
+        for key in message_dict:
+            if key not in seen:
+                seen.add(key)
+                keys.append(key)
+
+    columns = {}
+    dictionaries = {}
+    missing = {}
+    for key in keys:
+        column = []
+        missing_rows = []
+        if key in DICTIONARY_FIELDS:
+            codes = {}
+            for row, message_dict in enumerate(message_dicts):
+                if key not in message_dict:
+                    missing_rows.append(row)
+                    column.append(None)
+                else:
+                    column.append(codes.setdefault(message_dict[key], len(codes)))
+            dictionaries[key] = list(codes)
+        else:
+            for row, message_dict in enumerate(message_dicts):
+                if key not in message_dict:
+                    missing_rows.append(row)
+                column.append(message_dict.get(key))
+        columns[key] = column
+        if missing_rows:
+            missing[key] = missing_rows
+
+    return {
+        "length": len(message_dicts),
+        "columns": columns,
+        "dictionaries": dictionaries,
+        "missing": missing,
+    }
+
+
+def decode_columnar(block):
+    """
+    Inverse of encode_columnar. Returns the list of message dictionaries.
+    """
+    message_dicts = [{} for _ in range(block["length"])]
+    for key, column in block["columns"].items():
+        missing_rows = set(block["missing"].get(key, ()))
+        dictionary = block["dictionaries"].get(key)
+        for row, value in enumerate(column):
+            if row in missing_rows:
+                continue
+            message_dicts[row][key] = dictionary[value] if dictionary else value
+    return message_dicts
+
+
+class NdjsonArchiveHandler(BufferingHandler):
+    """
+    A handler that buffers structured log messages and appends them in large sequential
+    writes to NDJSON segment files named ``<base_filename>.<index>.ndjson[.gz]``. A new
+    segment is started as soon as the current one holds more than ``max_bytes`` of
+    (uncompressed) data.
+
+    The messages contain the same fields as the ones emitted by CeeSysLogHandler. In columnar
+    mode every flushed batch is written as a single line holding one column per field,
+    see encode_columnar.
+
+    Messages that could not be written are kept and written with the next flush, up to
+    ten times ``capacity`` messages. Records emitted after close are discarded.
+    """
+
+    def __init__(
+        self,
+        base_filename,
+        capacity=1000,
+        max_bytes=64 * 1024 * 1024,
+        compress=False,
+        columnar=False,
+        debugging_fields=True,
+        extra_fields=True,
+        facility=None,
+        **kwargs
+    ):
+        """
+        :param base_filename: Path prefix of the segment files
+        :param capacity: Number of messages buffered before they are written
+        :param max_bytes: Size of uncompressed data after which a new segment is started
+        :param compress: Whether to gzip the segment files
+        :param columnar: Whether to write columnar blocks instead of one line per message
+        :param debugging_fields: Whether to include file, line number, function, process and thread
+            id in the log
+        :param extra_fields: Whether to include extra fields (submitted via the keyword argument
+            extra to a logger) in the log dictionary
+        :param facility: If not specified uses the logger's name as facility
+        :param kwargs: Additional static fields to be injected in each message.
+        """
+        super(NdjsonArchiveHandler, self).__init__(capacity)
+        self._base_filename = os.path.abspath(base_filename)
+        self._max_bytes = max_bytes
+        self._compress = compress
+        self._columnar = columnar
+        self._debugging_fields = debugging_fields
+        self._extra_fields = extra_fields
+        self._facility = facility
+        self._static_fields = _sanitize_fields(kwargs)
+        self._fqdn = socket.getfqdn()
+        self._segment_index = 0
+        self._segment = None
+        self._segment_bytes = 0
+        self._closed = False
+
+    def _next_segment_filename(self):
+        suffix = ".ndjson.gz" if self._compress else ".ndjson"
+        while True:
+            filename = "{}.{:06d}{}".format(
+                self._base_filename, self._segment_index, suffix
+            )
+            self._segment_index += 1
+            if not os.path.exists(filename):
+                return filename
+
+    def _open_segment(self):
+        filename = self._next_segment_filename()
+        if self._compress:
+            self._segment = gzip.open(filename, "wb")
+        else:
+            self._segment = open(filename, "wb")
+        self._segment_bytes = 0
+
+    def _close_segment(self):
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+    def emit(self, record):
+        if self._closed:
+            return
+        # Build the message right away, the record may be altered after being handled
+        try:
+            self.buffer.append(
+                make_message_dict(
+                    record,
+                    self._fqdn,
+                    self._debugging_fields,
+                    self._extra_fields,
+                    self._facility,
+                    self._static_fields,
+                )
+            )
+            if self.shouldFlush(record):
+                self._write_buffer()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        try:
+            self._write_buffer()
+        except Exception:
+            self.handleError(None)
+
+    def _write_buffer(self):
+        self.acquire()
+        try:
+            if not self.buffer:
+                return
+            if self._columnar:
+                lines = [json.dumps(encode_columnar(self.buffer))]
+            else:
+                lines = [json.dumps(message_dict) for message_dict in self.buffer]
+            data = ("\n".join(lines) + "\n").encode("utf-8")
+
+            try:
+                if self._segment is None:
+                    self._open_segment()
+                self._segment.write(data)
+                self._segment.flush()
+            except Exception:
+                # continue in a new segment, the current one may hold a partial write
+                del self.buffer[: -10 * self.capacity]
+                try:
+                    self._close_segment()
+                except Exception:
+                    self._segment = None
+                raise
+            self.buffer = []
+            self._segment_bytes += len(data)
+            if self._segment_bytes >= self._max_bytes:
+                self._close_segment()
+        finally:
+            self.release()
+
+    def close(self):
+        self.acquire()
+        try:
+            self._closed = True
+            self.flush()
+            try:
+                self._close_segment()
+            except Exception:
+                self._segment = None
+                self.handleError(None)
+            # BufferingHandler.close would flush again
+            logging.Handler.close(self)
+        finally:
+            self.release()
+
+
+def read_segment(filename):
+    """
+    Yields the message dictionaries stored in a segment file written by NdjsonArchiveHandler.
+    """
+    opener = gzip.open if filename.endswith(".gz") else open
+    with opener(filename, "rt", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            if "columns" in data:
+                for message_dict in decode_columnar(data):
+                    yield message_dict
+            else:
+                yield data
+
+
+def replay_segments(filenames, handler, rate=None):
+    """
+    Re-sends the messages of the given segment files through a CeeSysLogHandler.
+
+    :param filenames: Segment files, replayed in the given order
+    :param handler: The CeeSysLogHandler to send the messages with
+    :param rate: If given, the maximum number of messages sent per second
+    :return: The number of replayed messages
+    """
+    interval = 1.0 / rate if rate else 0.0
+    start = time.monotonic()
+    count = 0
+    for filename in filenames:
+        for message_dict in read_segment(filename):
+            if interval:
+                delay = start + count * interval - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            handler.handle(make_replay_record(message_dict))
+            count += 1
+    return count
+
+
+def make_replay_record(message_dict):
+    """
+    Returns a log record that is formatted as the given archived message by CeeSysLogHandler.
+    """
+    return _ReplayRecord(
+        name=message_dict.get("_logger", message_dict.get("facility")),
+        levelno=_LOGGING_LEVELS.get(message_dict.get("level"), logging.WARNING),
+        msg=message_dict.get("short_message", ""),
+        created=message_dict.get("timestamp", time.time()),
+        message_dict=message_dict,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Replay archived NDJSON log segments to a syslog server."
+    )
+    parser.add_argument("segments", nargs="+", help="segment files or glob patterns")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=SYSLOG_UDP_PORT)
+    parser.add_argument("--tcp", action="store_true", help="use TCP instead of UDP")
+    parser.add_argument("--rate", type=float, help="maximum messages per second")
+    args = parser.parse_args(argv)
+
+    filenames = []
+    for pattern in args.segments:
+        filenames.extend(sorted(glob.glob(pattern)) or [pattern])
+
+    handler = CeeSysLogHandler(
+        address=(args.host, args.port),
+        socktype=socket.SOCK_STREAM if args.tcp else socket.SOCK_DGRAM,
+    )
+    try:
+        count = replay_segments(filenames, handler, rate=args.rate)
+    finally:
+        handler.close()
+    print("replayed {} messages".format(count))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import json
+import logging
+import os
+from logging import makeLogRecord
+
+from cee_syslog_handler import CeeSysLogHandler
+from cee_syslog_handler.archive import (
+    NdjsonArchiveHandler,
+    decode_columnar,
+    encode_columnar,
+    make_replay_record,
+    read_segment,
+    replay_segments,
+)
+
+
+class CollectingCeeSysLogHandler(CeeSysLogHandler):
+    def __init__(self, *args, **kwargs):
+        super(CollectingCeeSysLogHandler, self).__init__(*args, **kwargs)
+        self.formatted = []
+
+    def emit(self, record):
+        self.formatted.append(self.format(record))
+
+
+def _records(count):
+    return [
+        makeLogRecord(
+            {
+                "name": "my.package.logger",
+                "msg": "message %d",
+                "args": (i,),
+                "levelno": logging.INFO if i % 2 else logging.ERROR,
+                "special_field": i,
+            }
+        )
+        for i in range(count)
+    ]
+
+
+def _segments(tmpdir):
+    return sorted(str(p) for p in tmpdir.listdir())
+
+
+def test_columnar_roundtrip():
+    message_dicts = [
+        {"host": "a", "level": 6, "message": "foo"},
+        {"host": "a", "level": 3, "message": "bar", "_extra": 1},
+        {"host": "b", "level": 6, "message": "baz"},
+    ]
+    block = encode_columnar(message_dicts)
+
+    assert block["dictionaries"]["host"] == ["a", "b"]
+    assert block["columns"]["host"] == [0, 0, 1]
+    assert block["missing"] == {"_extra": [0, 2]}
+    assert decode_columnar(json.loads(json.dumps(block))) == message_dicts
+
+
+def test_archive_handler_buffers_records(tmpdir):
+    handler = NdjsonArchiveHandler(str(tmpdir.join("log")), capacity=10)
+    for record in _records(5):
+        handler.handle(record)
+    assert _segments(tmpdir) == []
+
+    handler.close()
+    segments = _segments(tmpdir)
+    assert [os.path.basename(s) for s in segments] == ["log.000000.ndjson"]
+
+    messages = list(read_segment(segments[0]))
+    assert [m["message"] for m in messages] == ["message %d" % i for i in range(5)]
+    assert [m["_special_field"] for m in messages] == list(range(5))
+    assert messages[0]["facility"] == "my.package.logger"
+
+
+def test_archive_handler_rotates_segments(tmpdir):
+    handler = NdjsonArchiveHandler(
+        str(tmpdir.join("log")), capacity=2, max_bytes=1, compress=True
+    )
+    for record in _records(5):
+        handler.handle(record)
+    handler.close()
+
+    segments = _segments(tmpdir)
+    assert [os.path.basename(s) for s in segments] == [
+        "log.000000.ndjson.gz",
+        "log.000001.ndjson.gz",
+        "log.000002.ndjson.gz",
+    ]
+    messages = [m for s in segments for m in read_segment(s)]
+    assert [m["message"] for m in messages] == ["message %d" % i for i in range(5)]
+
+
+def test_archive_handler_columnar(tmpdir):
+    plain = NdjsonArchiveHandler(str(tmpdir.join("plain")), debugging_fields=False)
+    columnar = NdjsonArchiveHandler(
+        str(tmpdir.join("columnar")), columnar=True, debugging_fields=False
+    )
+    for record in _records(20):
+        plain.handle(record)
+        columnar.handle(record)
+    plain.close()
+    columnar.close()
+
+    plain_segment, columnar_segment = (
+        str(tmpdir.join("plain.000000.ndjson")),
+        str(tmpdir.join("columnar.000000.ndjson")),
+    )
+    assert os.path.getsize(columnar_segment) < os.path.getsize(plain_segment)
+    assert list(read_segment(columnar_segment)) == list(read_segment(plain_segment))
+
+
+def test_replay(tmpdir):
+    archive = NdjsonArchiveHandler(str(tmpdir.join("log")), facility="archived")
+    for record in _records(3):
+        archive.handle(record)
+    archive.close()
+
+    handler = CollectingCeeSysLogHandler()
+    assert replay_segments(_segments(tmpdir), handler, rate=1000) == 3
+
+    messages = [json.loads(m[len(": @cee: ") :]) for m in handler.formatted]
+    assert messages == list(read_segment(_segments(tmpdir)[0]))
+    assert messages[0]["facility"] == "archived"
+    assert messages[0]["_logger"] == "my.package.logger"
+
+
+def test_replay_record():
+    record = make_replay_record(
+        {"level": 3, "short_message": "foo", "facility": "bar", "timestamp": 1.5}
+    )
+
+    assert record.levelno == logging.ERROR
+    assert record.levelname == "ERROR"
+    assert record.name == "bar"
+    assert record.getMessage() == "foo"
+    assert record.created == 1.5
+
+
+def test_archive_handler_keeps_messages_when_writing_fails(tmpdir, capsys):
+    directory = tmpdir.join("missing")
+    handler = NdjsonArchiveHandler(str(directory.join("log")), capacity=2)
+    for record in _records(3):
+        handler.handle(record)
+    assert "FileNotFoundError" in capsys.readouterr().err
+
+    directory.mkdir()
+    handler.close()
+
+    (segment,) = _segments(directory)
+    messages = list(read_segment(segment))
+    assert [m["message"] for m in messages] == ["message %d" % i for i in range(3)]
+
+
+def test_archive_handler_discards_records_after_close(tmpdir):
+    handler = NdjsonArchiveHandler(str(tmpdir.join("log")), capacity=1)
+    handler.close()
+
+    handler.handle(_records(1)[0])
+
+    assert _segments(tmpdir) == []
@@ -1,4 +1,12 @@
-from cee_syslog_handler import get_fields
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+
+from cee_syslog_handler import (
+    get_fields,
+    register_converter,
+    unregister_converter,
+)
 
 
 class Record(object):
@@ -29,3 +37,83 @@ def test_string_types():
 def test_numeric_types():
     check_single_value(1.1)
     check_single_value(1)
+
+
+def test_native_json_types():
+    check_single_value(True)
+
+    for value in (False, None):
+        record = Record()
+        record.some_column = value
+        assert get_fields({}, record) == {"_some_column": value}
+
+
+def test_datetime_types():
+    record = Record(datetime(2020, 10, 26, 13, 37, 0, 42))
+    assert get_fields({}, record) == {"_some_column": "2020-10-26T13:37:00.000042"}
+
+    record = Record(date(2020, 10, 26))
+    assert get_fields({}, record) == {"_some_column": "2020-10-26"}
+
+
+def test_fallback_to_str():
+    value = uuid.uuid4()
+    assert get_fields({}, Record(value)) == {"_some_column": str(value)}
+    assert get_fields({}, Record(Decimal("1.10"))) == {"_some_column": "1.10"}
+    assert get_fields({}, Record([1, 2])) == {"_some_column": "[1, 2]"}
+
+
+def test_nested_dict_is_flattened():
+    record = Record({"user": {"id": 42, "tags": ["a"]}, "ok": True})
+    assert get_fields({}, record) == {
+        "_some_column.user.id": 42,
+        "_some_column.user.tags": "['a']",
+        "_some_column.ok": True,
+    }
+
+
+def test_flattened_dict_keeps_colliding_fields():
+    record = Record({"b": 1})
+    record.some_column_b = 2
+    assert get_fields({}, record) == {"_some_column.b": 1, "_some_column_b": 2}
+
+
+def test_empty_dict():
+    assert get_fields({}, Record({"a": {}})) == {"_some_column.a": "{}"}
+
+    record = Record()
+    record.some_column = {}
+    assert get_fields({}, record) == {"_some_column": "{}"}
+
+
+def test_invalid_converter_result_falls_back_to_str():
+    class Custom(object):
+        def __str__(self):
+            return "custom"
+
+    try:
+        register_converter(Custom, lambda value: [value])
+        assert get_fields({}, Record(Custom())) == {"_some_column": "custom"}
+        register_converter(Custom, lambda value: {"v": [1]})
+        assert get_fields({}, Record(Custom())) == {"_some_column.v": "[1]"}
+
+        def raising(value):
+            raise ValueError()
+
+        register_converter(Custom, raising)
+        assert get_fields({}, Record(Custom())) == {"_some_column": "custom"}
+    finally:
+        unregister_converter(Custom)
+
+
+def test_register_converter():
+    class Money(Decimal):
+        pass
+
+    try:
+        register_converter(Decimal, float)
+        assert get_fields({}, Record(Decimal("1.5"))) == {"_some_column": 1.5}
+        assert get_fields({}, Record(Money("2.5"))) == {"_some_column": 2.5}
+    finally:
+        unregister_converter(Decimal)
+    assert get_fields({}, Record(Money("2.5"))) == {"_some_column": "2.5"}
@@ -197,6 +197,69 @@ def test_filter_bypass():
     assert ("web.service", 42) == log_record.args
 
 
+def test_logger_name_filter():
+    handler = CollectingNamedCeeLogger(_DUMMY_HOST, _DUMMY_PROTOCOL, "myname")
+    handler.addFilter(logging.Filter("my.package"))
+
+    handler.handle(makeLogRecord({"name": "my.package.logger", "msg": "foo"}))
+    handler.handle(makeLogRecord({"name": "other.logger", "msg": "foo"}))
+    handler.handle(makeLogRecord({"name": "my.package.logger", "msg": "bar"}))
+    handler.handle(makeLogRecord({"name": "other.logger", "msg": "bar"}))
+
+    assert [r.name for r in handler.emitted_records] == [
+        "my.package.logger",
+        "my.package.logger",
+    ]
+
+
+def test_logger_cache_invalidated_on_filter_change():
+    handler = CollectingNamedCeeLogger(_DUMMY_HOST, _DUMMY_PROTOCOL, "myname")
+    name_filter = logging.Filter("my.package")
+    handler.addFilter(name_filter)
+
+    handler.handle(makeLogRecord({"name": "other.logger", "msg": "foo"}))
+    assert len(handler.emitted_records) == 0
+
+    handler.removeFilter(name_filter)
+    handler.handle(makeLogRecord({"name": "other.logger", "msg": "foo"}))
+    assert len(handler.emitted_records) == 1
+
+    handler.addFilter(RegexFilter("foo"))
+    handler.handle(makeLogRecord({"name": "other.logger", "msg": "foo"}))
+    assert len(handler.emitted_records) == 1
+
+
+def test_entry_built_during_filter_change_is_not_cached():
+    handler = CollectingNamedCeeLogger(_DUMMY_HOST, _DUMMY_PROTOCOL, "myname")
+
+    class ChangingFilters(list):
+        # adds a filter while the cache entry is built from the previous filters
+        def __iter__(self):
+            items = iter(list(list.__iter__(self)))
+            if not self:
+                self.append(logging.Filter("keep"))
+                handler.clear_logger_cache()
+            return items
+
+    handler.filters = ChangingFilters()
+    handler.handle(makeLogRecord({"name": "other.logger", "msg": "foo"}))
+    handler.handle(makeLogRecord({"name": "other.logger", "msg": "foo"}))
+
+    assert len(handler.emitted_records) == 1
+
+
+def test_filters_applied_in_configured_order():
+    record = makeLogRecord({"name": "other.logger", "msg": "my secret"})
+    handler = CollectingNamedCeeLogger(_DUMMY_HOST, _DUMMY_PROTOCOL, "myname")
+    handler.addFilter(RegexRedactFilter("secret"))
+    handler.addFilter(logging.Filter("keep"))
+
+    handler.handle(record)
+
+    assert len(handler.emitted_records) == 0
+    assert record.getMessage() == "my <redacted>"
+
+
 class SomeClass:
     """
     generic helper class
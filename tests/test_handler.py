@@ -1,6 +1,10 @@
+import json
+import socket
+import threading
+import time
 from logging import makeLogRecord
 
-from cee_syslog_handler import CeeSysLogHandler
+from cee_syslog_handler import AsyncCeeSysLogHandler, CeeSysLogHandler
 
 
 def test_default_facility():
@@ -80,3 +84,156 @@ def test_custom_field_with_raising_str():
     assert '"_custom_field": "value could not be converted to str"' in handler.format(
         record
     )
+
+
+def test_changing_custom_facility():
+    record = makeLogRecord({"name": "my.package.logger"})
+    handler = CeeSysLogHandler()
+    assert '"facility": "my.package.logger"' in handler.format(record)
+
+    handler.cee_facility = "my.custom.facility"
+
+    assert '"facility": "my.custom.facility"' in handler.format(record)
+    assert '"_logger": "my.package.logger"' in handler.format(record)
+
+
+def _udp_server():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(("localhost", 0))
+    server.settimeout(5)
+    return server
+
+
+def _receive(server, count):
+    return [server.recv(65536).decode("utf-8") for _ in range(count)]
+
+
+def _parse(message):
+    return json.loads(message.split(": @cee: ", 1)[1].rstrip("\000"))
+
+
+def test_send_message():
+    server = _udp_server()
+    handler = CeeSysLogHandler(address=server.getsockname())
+    handler.handle(makeLogRecord({"name": "my.package.logger", "msg": "foo"}))
+    handler.close()
+
+    (message,) = _receive(server, 1)
+    server.close()
+    assert message.startswith("<12>: @cee: {")
+    assert _parse(message)["message"] == "foo"
+
+
+def test_format_outside_handler_lock():
+    class SignalingHandler(CeeSysLogHandler):
+        formatted = threading.Event()
+
+        def format(self, record):
+            self.formatted.set()
+            return super(SignalingHandler, self).format(record)
+
+    server = _udp_server()
+    handler = SignalingHandler(address=server.getsockname())
+    record = makeLogRecord({"name": "my.package.logger", "msg": "foo"})
+    thread = threading.Thread(target=handler.handle, args=(record,))
+
+    handler.acquire()
+    try:
+        thread.start()
+        assert handler.formatted.wait(5)
+    finally:
+        handler.release()
+    thread.join()
+    handler.close()
+
+    assert len(_receive(server, 1)) == 1
+    server.close()
+
+
+def test_async_handler_sends_from_many_threads():
+    server = _udp_server()
+    handler = AsyncCeeSysLogHandler(address=server.getsockname())
+
+    def log(thread_index):
+        for i in range(10):
+            handler.handle(
+                makeLogRecord(
+                    {"name": "my.package.logger", "msg": "%d-%d" % (thread_index, i)}
+                )
+            )
+
+    threads = [threading.Thread(target=log, args=(t,)) for t in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    handler.flush()
+    handler.close()
+
+    messages = _receive(server, 80)
+    server.close()
+    received = sorted(_parse(m)["message"] for m in messages)
+    assert received == sorted("%d-%d" % (t, i) for t in range(8) for i in range(10))
+
+
+def test_extra_cannot_replace_message():
+    record = makeLogRecord(
+        {"name": "my.package.logger", "msg": "foo", "cee_message_dict": {"forged": 1}}
+    )
+    message = _parse(CeeSysLogHandler().format(record))
+
+    assert "forged" not in message
+    assert message["message"] == "foo"
+
+
+class _BlockingAsyncHandler(AsyncCeeSysLogHandler):
+    def __init__(self, *args, **kwargs):
+        self.unblocked = threading.Event()
+        self.sent = []
+        super(_BlockingAsyncHandler, self).__init__(*args, **kwargs)
+
+    def _send_message(self, data):
+        self.unblocked.wait(5)
+        self.sent.append(data)
+
+
+def test_async_handler_drops_when_queue_is_full():
+    handler = _BlockingAsyncHandler(max_queue_size=1)
+    record = makeLogRecord({"name": "my.package.logger", "msg": "foo"})
+
+    for _ in range(5):
+        handler.handle(record)
+    # the writer may already have taken the first message off the queue
+    assert handler.dropped_count in (3, 4)
+
+    handler.unblocked.set()
+    handler.close()
+    assert len(handler.sent) == 5 - handler.dropped_count
+
+
+def test_async_handler_sends_synchronously_after_close():
+    handler = _BlockingAsyncHandler()
+    handler.unblocked.set()
+    handler.close()
+
+    handler.handle(makeLogRecord({"name": "my.package.logger", "msg": "foo"}))
+
+    assert handler._queue.qsize() == 0
+    assert len(handler.sent) == 1
+
+
+def test_async_handler_close_is_bounded():
+    handler = _BlockingAsyncHandler(max_queue_size=2, close_timeout=0.1)
+    record = makeLogRecord({"name": "my.package.logger", "msg": "foo"})
+    for _ in range(3):
+        handler.handle(record)
+
+    start = time.monotonic()
+    handler.close()
+
+    assert time.monotonic() - start < 1
+
+    handler.unblocked.set()
+    handler._writer.join(5)
+    assert handler.dropped_count + len(handler.sent) == 3
+    assert handler.dropped_count >= 2
@@ -0,0 +1,170 @@
+import logging
+import socket
+import threading
+import time
+from logging import makeLogRecord
+
+from cee_syslog_handler import CeeSysLogHandler, HealthMonitor
+
+
+def _record(levelno, msg="foo"):
+    return makeLogRecord(
+        {
+            "name": "my.package.logger",
+            "msg": msg,
+            "levelno": levelno,
+            "levelname": logging.getLevelName(levelno),
+        }
+    )
+
+
+def test_health_transitions():
+    monitor = HealthMonitor(window=4, min_samples=4, probe_interval=3600)
+    for _ in range(4):
+        monitor.record_send(0.001)
+    assert monitor.state == HealthMonitor.HEALTHY
+    assert monitor.history == []
+
+    monitor.record_send(0.2)
+    assert monitor.state == HealthMonitor.DEGRADED
+    assert not monitor.accepts(logging.INFO)
+    assert monitor.accepts(logging.WARNING)
+
+    for _ in range(3):
+        monitor.record_send(0.001, failed=True)
+    assert monitor.state == HealthMonitor.SHEDDING
+    assert not monitor.accepts(logging.WARNING)
+    assert monitor.accepts(logging.ERROR)
+    assert monitor.shed_count == 2
+
+    for _ in range(4):
+        monitor.record_send(0.001)
+    assert monitor.state == HealthMonitor.HEALTHY
+    assert [(t.old_state, t.new_state) for t in monitor.history] == [
+        (HealthMonitor.HEALTHY, HealthMonitor.DEGRADED),
+        (HealthMonitor.DEGRADED, HealthMonitor.SHEDDING),
+        (HealthMonitor.SHEDDING, HealthMonitor.DEGRADED),
+        (HealthMonitor.DEGRADED, HealthMonitor.HEALTHY),
+    ]
+
+
+def test_probe_while_shedding():
+    monitor = HealthMonitor(window=1, min_samples=1, probe_interval=0)
+    monitor.record_send(0, failed=True)
+    assert monitor.state == HealthMonitor.SHEDDING
+    assert monitor.accepts(logging.DEBUG)
+
+
+def test_old_samples_age_out():
+    monitor = HealthMonitor(window=10, min_samples=2, sample_horizon=0.05)
+    for _ in range(2):
+        monitor.record_send(0, failed=True)
+    assert monitor.state == HealthMonitor.SHEDDING
+
+    time.sleep(0.1)
+    monitor.record_send(0.001)
+    assert monitor.state == HealthMonitor.HEALTHY
+
+
+def test_filtered_records_are_not_shed():
+    monitor = HealthMonitor(window=1, min_samples=1, probe_interval=3600)
+    monitor.record_send(0, failed=True)
+    handler = CeeSysLogHandler(health_monitor=monitor)
+    handler.addFilter(logging.Filter("other"))
+
+    assert not handler.handle(_record(logging.INFO))
+    assert monitor.shed_count == 0
+    handler.close()
+
+
+def test_error_reports_are_rate_limited(capsys):
+    monitor = HealthMonitor(error_report_interval=3600)
+    # the handler connects while the server listens, closing the server resets the
+    # connection, so every send fails
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("localhost", 0))
+    server.listen(1)
+    handler = CeeSysLogHandler(
+        address=server.getsockname(),
+        socktype=socket.SOCK_STREAM,
+        health_monitor=monitor,
+    )
+    server.close()
+
+    for _ in range(5):
+        handler.handle(_record(logging.ERROR))
+    handler.close()
+
+    assert capsys.readouterr().err.count("--- Logging error ---") == 1
+    assert monitor.suppressed_error_count == 4
+
+
+def _throttled_server(stop):
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    server.bind(("localhost", 0))
+    server.listen(1)
+
+    def serve():
+        connection, _ = server.accept()
+        while not stop.is_set():
+            if not connection.recv(1024):
+                break
+            time.sleep(0.001)
+        connection.close()
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    return server, thread
+
+
+def test_shedding_on_slow_collector():
+    stop = threading.Event()
+    server, thread = _throttled_server(stop)
+    monitor = HealthMonitor(
+        window=3, min_samples=3, degraded_latency=0.005, probe_interval=3600
+    )
+    handler = CeeSysLogHandler(
+        address=server.getsockname(),
+        socktype=socket.SOCK_STREAM,
+        health_monitor=monitor,
+    )
+    handler.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+
+    try:
+        for _ in range(6):
+            assert handler.handle(_record(logging.ERROR, msg="x" * 50000))
+        assert monitor.state != HealthMonitor.HEALTHY
+        assert not handler.handle(_record(logging.INFO))
+        assert monitor.shed_count == 1
+    finally:
+        stop.set()
+        handler.close()
+        thread.join()
+        server.close()
+
+
+def test_send_timeout_on_stalled_collector():
+    # the server accepts the connection but never reads from it
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("localhost", 0))
+    server.listen(1)
+    monitor = HealthMonitor(window=2, min_samples=2, error_report_interval=3600)
+    handler = CeeSysLogHandler(
+        address=server.getsockname(),
+        socktype=socket.SOCK_STREAM,
+        health_monitor=monitor,
+        send_timeout=0.1,
+    )
+    connection, _ = server.accept()
+
+    try:
+        start = time.monotonic()
+        for _ in range(2):
+            handler.handle(_record(logging.ERROR, msg="x" * 10000000))
+        assert time.monotonic() - start < 5
+        assert monitor.state == HealthMonitor.SHEDDING
+    finally:
+        handler.close()
+        connection.close()
+        server.close()